@@ -4,8 +4,13 @@
 import os
 import shutil
 import tarfile
-from typing import Dict, List
+from bisect import bisect_left, insort
+from copy import deepcopy
+from functools import lru_cache
+from math import floor
+from typing import Dict, List, Tuple
 
+import numpy as np
 from yaml import safe_load
 
 from maro.backends.frame import FrameBase, SnapshotList
@@ -23,6 +28,7 @@ from .enums import Events, PmState, PostponeType, VmCategory
 from .frame_builder import build_frame
 from .physical_machine import PhysicalMachine
 from .virtual_machine import VirtualMachine
+from .workload import cpu_utilization_to_energy_consumption, sum_pm_cpu_cores_used
 
 metrics_desc = """
 VM scheduling metrics used provide statistics information until now.
@@ -47,6 +53,16 @@ total_overload_vms (int): Accumulative VMs on overload pms. The unit is VM amoun
 logger = CliLogger(name=__name__)
 
 
+@lru_cache(maxsize=None)
+def _load_yaml(path: str, modified_time: float) -> dict:
+    """Load the YAML file, the parsed result is cached by the file path and its modified time.
+
+    NOTE: The cached result is shared, make a copy before modifying it.
+    """
+    with open(path) as fp:
+        return safe_load(fp)
+
+
 class VmSchedulingBusinessEngine(AbsBusinessEngine):
     def __init__(
         self,
@@ -79,6 +95,8 @@ class VmSchedulingBusinessEngine(AbsBusinessEngine):
 
         # All living VMs.
         self._live_vms: Dict[int, VirtualMachine] = {}
+        # Structure-of-arrays table of the living VMs, indexed by the VM slot.
+        self._init_vm_table()
         # All request payload of the pending decision VMs.
         # NOTE: Need naming suggestestion.
         self._pending_vm_request_payload: Dict[int, VmRequestPayload] = {}
@@ -110,8 +128,8 @@ class VmSchedulingBusinessEngine(AbsBusinessEngine):
         """Load configurations."""
         # Update self._config_path with current file path.
         self.update_config_root_path(__file__)
-        with open(os.path.join(self._config_path, "config.yml")) as fp:
-            self._config = convert_dottable(safe_load(fp))
+        config_path = os.path.abspath(os.path.join(self._config_path, "config.yml"))
+        self._config = convert_dottable(deepcopy(_load_yaml(config_path, os.path.getmtime(config_path))))
 
         self._delay_duration: int = self._config.DELAY_DURATION
         self._buffer_time_budget: int = self._config.BUFFER_TIME_BUDGET
@@ -250,8 +268,18 @@ class VmSchedulingBusinessEngine(AbsBusinessEngine):
         self._cluster_id = 0
         self._rack_id = 0
         self._pm_id = 0
+        # PM resources in structure-of-arrays layout, indexed by the PM id.
+        self._pm_cpu_cores_capacity: np.ndarray = np.zeros(self._pm_amount, dtype=np.int32)
+        self._pm_memory_capacity: np.ndarray = np.zeros(self._pm_amount, dtype=np.int32)
+        # The power curve parameters of each PM, used to compute the energy consumption of all the PMs at once.
+        self._pm_idle_power: np.ndarray = np.zeros(self._pm_amount, dtype=np.float64)
+        self._pm_busy_power: np.ndarray = np.zeros(self._pm_amount, dtype=np.float64)
+        self._pm_power_calibration_parameter: np.ndarray = np.zeros(self._pm_amount, dtype=np.float64)
         # Initialize regions.
         self._init_regions()
+        # The capacities are fixed by the config, so the divisions by the capacity are replaced by multiplications.
+        self._pm_inv_cpu_cores_capacity: np.ndarray = 1.0 / self._pm_cpu_cores_capacity
+        self._init_pm_resource_states()
 
     def _init_regions(self):
         """Initialize the regions based on the config setting. The regions id starts from 0."""
@@ -382,6 +410,11 @@ class VmSchedulingBusinessEngine(AbsBusinessEngine):
         start_pm_id = self._pm_id
         for pm_type, pm_amount in pm_dict.items():
             while pm_amount > 0:
+                power_curve = self._pm_config_dict[pm_type]["power_curve"]
+                self._pm_idle_power[self._pm_id] = power_curve["idle_power"]
+                self._pm_busy_power[self._pm_id] = power_curve["busy_power"]
+                self._pm_power_calibration_parameter[self._pm_id] = power_curve["calibration_parameter"]
+
                 pm = self._machines[self._pm_id]
                 pm.set_init_state(
                     id=self._pm_id,
@@ -395,16 +428,184 @@ class VmSchedulingBusinessEngine(AbsBusinessEngine):
                     rack_id=self._rack_id,
                     oversubscribable=PmState.EMPTY,
                     idle_energy_consumption=self._cpu_utilization_to_energy_consumption(
-                        pm_type=self._pm_config_dict[pm_type],
+                        pm_id=self._pm_id,
                         cpu_utilization=0
                     )
                 )
+                self._pm_cpu_cores_capacity[self._pm_id] = self._pm_config_dict[pm_type]["cpu"]
+                self._pm_memory_capacity[self._pm_id] = self._pm_config_dict[pm_type]["memory"]
 
                 pm_amount -= 1
                 self._pm_id += 1
 
         return start_pm_id
 
+    def _init_pm_resource_states(self):
+        """Initialize the PM resource states mirrored from the frame, and the index of PMs sorted by free CPU cores.
+
+        The mirrored states are used to check the valid PMs with vectorized operations.
+        The index is a sorted list of (free CPU cores, PM id) pairs, which is updated incrementally when the
+        allocated CPU cores of a PM changes, so the PMs with enough free CPU cores can be enumerated by bisection.
+        """
+        self._pm_cpu_cores_allocated: np.ndarray = np.zeros(self._pm_amount, dtype=np.int32)
+        self._pm_memory_allocated: np.ndarray = np.zeros(self._pm_amount, dtype=np.int32)
+        self._pm_oversubscribable: np.ndarray = np.full(self._pm_amount, PmState.EMPTY, dtype=np.int8)
+        # Same precision as the cpu_utilization attribute in the frame.
+        self._pm_cpu_utilization: np.ndarray = np.zeros(self._pm_amount, dtype=np.float32)
+        # The running sum of CPU utilization * CPU cores requirement of the VMs on each PM.
+        # NOTE: Keep it in float64, since it is patched by the deltas of VM CPU utilization tick by tick.
+        self._pm_cpu_cores_used: np.ndarray = np.zeros(self._pm_amount, dtype=np.float64)
+        # The number of living VMs on each PM, the VMs themselves can be found by the PM id column of the VM table.
+        self._pm_live_vm_amount: np.ndarray = np.zeros(self._pm_amount, dtype=np.int64)
+
+        self._pm_free_cpu_cores_index: List[Tuple[int, int]] = sorted(
+            (int(cpu_cores_capacity), pm_id) for pm_id, cpu_cores_capacity in enumerate(self._pm_cpu_cores_capacity)
+        )
+        # The largest amount of CPU cores that oversubscription adds to a PM, used to bound the index lookup.
+        self._max_oversubscribed_cpu_cores: float = float(
+            ((self._max_cpu_oversubscription_rate - 1) * self._pm_cpu_cores_capacity).max()
+        )
+
+    def _update_pm_allocated_resource(self, pm: PhysicalMachine, cpu_cores: int, memory: int):
+        """Add the resource (negative for release) to the allocated resource of the PM, and update the index."""
+        pm_id = pm.id
+        index = self._pm_free_cpu_cores_index
+        free_cpu_cores = int(self._pm_cpu_cores_capacity[pm_id] - self._pm_cpu_cores_allocated[pm_id])
+        index.pop(bisect_left(index, (free_cpu_cores, pm_id)))
+        insort(index, (free_cpu_cores - cpu_cores, pm_id))
+
+        pm.cpu_cores_allocated += cpu_cores
+        pm.memory_allocated += memory
+        self._pm_cpu_cores_allocated[pm_id] += cpu_cores
+        self._pm_memory_allocated[pm_id] += memory
+
+    def _update_pm_oversubscribable(self, pm: PhysicalMachine, oversubscribable: PmState):
+        """Update the oversubscribable state of the PM in both the frame and the mirrored states."""
+        pm.oversubscribable = oversubscribable
+        self._pm_oversubscribable[pm.id] = oversubscribable
+
+    def _get_pms_with_free_cpu_cores(self, min_free_cpu_cores: float) -> np.ndarray:
+        """Get the id of the PMs with at least the given free CPU cores, in an ascending order of the free CPU cores."""
+        index = self._pm_free_cpu_cores_index
+
+        return np.array(
+            [pm_id for _, pm_id in index[bisect_left(index, (floor(min_free_cpu_cores), -1)):]], dtype=np.int64
+        )
+
+    def _init_vm_table(self, capacity: int = 1024, series_capacity: int = 64):
+        """Initialize the structure-of-arrays table of the living VMs.
+
+        Each living VM takes one slot of the table, the slots of the dead VMs are recycled by a free list,
+        and the arrays are doubled when all the slots are used.
+        Dead slots keep a zero CPU cores requirement, so they do not contribute to any PM.
+
+        The CPU utilization series of the living VMs are kept in a dense matrix, one row per slot,
+        column j of a row is the utilization at the j-th tick since the VM was requested.
+        The CPU readings are float32 in the data file, so float32 is enough to hold the utilization without loss.
+        """
+        self._vm_slot_amount: int = 0
+        self._vm_free_slots: List[int] = []
+        self._vm_slot_to_vm: List[VirtualMachine] = [None] * capacity
+        self._vm_alive: np.ndarray = np.zeros(capacity, dtype=np.bool_)
+        self._vm_cpu_cores_requirement: np.ndarray = np.zeros(capacity, dtype=np.int32)
+        self._vm_cpu_utilization: np.ndarray = np.zeros(capacity, dtype=np.float32)
+        self._vm_pm_id: np.ndarray = np.zeros(capacity, dtype=np.int64)
+        self._vm_deletion_tick: np.ndarray = np.zeros(capacity, dtype=np.int64)
+        self._vm_id: np.ndarray = np.zeros(capacity, dtype=np.int64)
+        self._vm_creation_tick: np.ndarray = np.zeros(capacity, dtype=np.int64)
+        self._vm_series_length: np.ndarray = np.zeros(capacity, dtype=np.int64)
+        self._vm_utilization_series: np.ndarray = np.zeros((capacity, series_capacity), dtype=np.float32)
+
+    def _get_vm_slot(self) -> int:
+        """Get a free slot from the VM table, the table is enlarged if there is no free slot."""
+        if self._vm_free_slots:
+            return self._vm_free_slots.pop()
+
+        if self._vm_slot_amount == len(self._vm_alive):
+            capacity = 2 * len(self._vm_alive)
+            self._vm_slot_to_vm.extend([None] * (capacity - len(self._vm_slot_to_vm)))
+            for name in (
+                "_vm_alive", "_vm_cpu_cores_requirement", "_vm_cpu_utilization", "_vm_pm_id", "_vm_deletion_tick",
+                "_vm_id", "_vm_creation_tick", "_vm_series_length", "_vm_utilization_series"
+            ):
+                array = getattr(self, name)
+                new_array = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+                new_array[:len(array)] = array
+                setattr(self, name, new_array)
+
+        self._vm_slot_amount += 1
+
+        return self._vm_slot_amount - 1
+
+    def _reserve_vm_utilization_series(self, length: int):
+        """Make sure the utilization series matrix can hold the given length of series, by doubling its columns."""
+        series_capacity = self._vm_utilization_series.shape[1]
+        if length > series_capacity:
+            while length > series_capacity:
+                series_capacity *= 2
+            new_series = np.zeros(
+                (len(self._vm_utilization_series), series_capacity), dtype=self._vm_utilization_series.dtype
+            )
+            new_series[:, :self._vm_utilization_series.shape[1]] = self._vm_utilization_series
+            self._vm_utilization_series = new_series
+
+    def _get_live_vm_slots(self) -> np.ndarray:
+        """Get the slots of all the living VMs."""
+        return np.flatnonzero(self._vm_alive[:self._vm_slot_amount])
+
+    def _get_pm_live_vm_ids(self, pm_id: int) -> List[int]:
+        """Get the id of the living VMs allocated on the PM."""
+        vm_slot_amount = self._vm_slot_amount
+        pm_vm_slots = np.flatnonzero(self._vm_alive[:vm_slot_amount] & (self._vm_pm_id[:vm_slot_amount] == pm_id))
+
+        return self._vm_id[pm_vm_slots].tolist()
+
+    def _add_live_vm(self, vm: VirtualMachine):
+        """Add the allocated VM into the live VM dict and the VM table."""
+        slot = self._get_vm_slot()
+
+        self._vm_slot_to_vm[slot] = vm
+        self._vm_alive[slot] = True
+        self._vm_cpu_cores_requirement[slot] = vm.cpu_cores_requirement
+        self._vm_cpu_utilization[slot] = vm.cpu_utilization
+        self._vm_pm_id[slot] = vm.pm_id
+        self._vm_deletion_tick[slot] = vm.deletion_tick
+        self._vm_id[slot] = vm.id
+        self._vm_creation_tick[slot] = vm.creation_tick
+
+        # Move the utilization series collected since the VM was requested into the series matrix.
+        utilization_series = vm.utilization_series
+        self._reserve_vm_utilization_series(len(utilization_series))
+        self._vm_utilization_series[slot, :len(utilization_series)] = utilization_series
+        self._vm_series_length[slot] = len(utilization_series)
+
+        self._pm_cpu_cores_used[vm.pm_id] += vm.cpu_utilization * vm.cpu_cores_requirement
+        self._pm_live_vm_amount[vm.pm_id] += 1
+        self._live_vms[vm.id] = vm
+        # From now on, the states of the VM object are read from the VM table.
+        vm.attach_to_vm_table(vm_table=self, slot=slot)
+
+    def _remove_live_vm(self, vm_id: int) -> VirtualMachine:
+        """Remove the VM from the live VM dict and recycle its slot in the VM table."""
+        vm = self._live_vms.pop(vm_id)
+        slot = vm.slot
+        # Keep the final states in the VM object, since the slot will be reused.
+        vm.detach_from_vm_table()
+
+        self._pm_cpu_cores_used[vm.pm_id] -= (
+            float(self._vm_cpu_utilization[slot]) * vm.cpu_cores_requirement
+        )
+        self._pm_live_vm_amount[vm.pm_id] -= 1
+
+        self._vm_slot_to_vm[slot] = None
+        self._vm_alive[slot] = False
+        self._vm_cpu_cores_requirement[slot] = 0
+        self._vm_cpu_utilization[slot] = 0
+        self._vm_pm_id[slot] = 0
+        self._vm_free_slots.append(slot)
+
+        return vm
+
     def reset(self):
         """Reset internal states for episode."""
         self._init_metrics()
@@ -430,7 +631,12 @@ class VmSchedulingBusinessEngine(AbsBusinessEngine):
         for region in self._regions:
             region.reset()
 
+        self._init_pm_resource_states()
+
+        for vm in self._live_vms.values():
+            vm.detach_from_vm_table()
         self._live_vms.clear()
+        self._init_vm_table()
         self._pending_vm_request_payload.clear()
 
         self._vm_reader.reset()
@@ -592,20 +798,60 @@ class VmSchedulingBusinessEngine(AbsBusinessEngine):
         The length of VMs utilization series could be difference among all VMs,
         because index 0 represents the VM's CPU utilization at the tick it starts.
         """
-        for live_vm in self._live_vms.values():
-            # NOTE: Some data could be lost. We use -1.0 to represent the missing data.
-            if live_vm.id not in cur_tick_cpu_utilization:
-                live_vm.add_utilization(cpu_utilization=-1.0)
-            else:
-                live_vm.add_utilization(cpu_utilization=cur_tick_cpu_utilization[live_vm.id])
-                live_vm.cpu_utilization = live_vm.get_utilization(cur_tick=self._tick)
+        live_vm_slots = self._get_live_vm_slots()
+        if len(live_vm_slots) > 0:
+            self._update_live_vm_workload(
+                live_vm_slots=live_vm_slots, cur_tick_cpu_utilization=cur_tick_cpu_utilization
+            )
 
         for pending_vm_payload in self._pending_vm_request_payload.values():
             pending_vm = pending_vm_payload.vm_info
-            if pending_vm.id not in cur_tick_cpu_utilization:
-                pending_vm.add_utilization(cpu_utilization=-1.0)
-            else:
-                pending_vm.add_utilization(cpu_utilization=cur_tick_cpu_utilization[pending_vm.id])
+            # NOTE: -1.0 represents the missing data.
+            pending_vm.add_utilization(cpu_utilization=cur_tick_cpu_utilization.get(pending_vm.id, -1.0))
+
+    def _update_live_vm_workload(self, live_vm_slots: np.ndarray, cur_tick_cpu_utilization: dict):
+        """Append the current CPU utilization to the series of the living VMs and update their CPU utilization.
+
+        The living VMs are updated in the VM table with vectorized operations, the series is gathered with
+        the offset of current tick to the VM creation tick.
+        """
+        vm_ids = self._vm_id[live_vm_slots]
+        reading_amount = len(cur_tick_cpu_utilization)
+        if reading_amount > 0:
+            reading_vm_ids = np.fromiter(cur_tick_cpu_utilization.keys(), dtype=np.int64, count=reading_amount)
+            readings = np.fromiter(cur_tick_cpu_utilization.values(), dtype=np.float64, count=reading_amount)
+            reading_order = np.argsort(reading_vm_ids)
+            reading_vm_ids = reading_vm_ids[reading_order]
+            readings = readings[reading_order]
+
+            positions = np.minimum(np.searchsorted(reading_vm_ids, vm_ids), reading_amount - 1)
+            has_reading = reading_vm_ids[positions] == vm_ids
+            readings = readings[positions]
+        else:
+            has_reading = np.zeros(len(live_vm_slots), dtype=np.bool_)
+            readings = np.zeros(len(live_vm_slots), dtype=np.float64)
+
+        series_length = self._vm_series_length[live_vm_slots]
+        self._reserve_vm_utilization_series(int(series_length.max()) + 1)
+        series = self._vm_utilization_series
+        # NOTE: Some data could be lost. A missing or negative reading is filled by the last utilization.
+        series[live_vm_slots, series_length] = np.where(
+            has_reading & (readings >= 0), readings, series[live_vm_slots, series_length - 1]
+        )
+        self._vm_series_length[live_vm_slots] = series_length + 1
+
+        # Only the VMs with data at current tick update their CPU utilization.
+        updated_slots = live_vm_slots[has_reading]
+        cpu_utilization = np.clip(series[updated_slots, self._tick - self._vm_creation_tick[updated_slots]], 0, 100)
+        # Patch the PM running sums with the changes of VM CPU utilization.
+        self._pm_cpu_cores_used += sum_pm_cpu_cores_used(
+            vm_pm_id=self._vm_pm_id[updated_slots],
+            vm_cpu_utilization=cpu_utilization.astype(np.float64) - self._vm_cpu_utilization[updated_slots],
+            vm_cpu_cores_requirement=self._vm_cpu_cores_requirement[updated_slots],
+            vm_amount=len(updated_slots),
+            pm_amount=self._pm_amount
+        )
+        self._vm_cpu_utilization[updated_slots] = cpu_utilization
 
     def _update_upper_level_metrics(self):
         self._update_rack_metrics()
@@ -639,26 +885,36 @@ class VmSchedulingBusinessEngine(AbsBusinessEngine):
             )
 
     def _update_rack_metrics(self):
+        # Read the allocated CPU cores from the mirrored states instead of the PM nodes.
+        is_empty_pm: List[bool] = (self._pm_cpu_cores_allocated == 0).tolist()
         for rack in self._racks:
-            count_empty_machine: int = 0
-            for pm_id in rack.pm_list:
-                pm = self._machines[pm_id]
-                if pm.cpu_cores_allocated == 0:
-                    count_empty_machine += 1
-            rack.empty_machine_num = count_empty_machine
+            rack.empty_machine_num = sum(is_empty_pm[pm_id] for pm_id in rack.pm_list)
 
     def _update_pm_workload(self):
-        """Update CPU utilization occupied by total VMs on each PM."""
-        for pm in self._machines:
-            total_pm_cpu_cores_used: float = 0.0
-            for vm_id in pm.live_vms:
-                vm = self._live_vms[vm_id]
-                total_pm_cpu_cores_used += vm.cpu_utilization * vm.cpu_cores_requirement
-            pm.update_cpu_utilization(vm=None, cpu_utilization=total_pm_cpu_cores_used / pm.cpu_cores_capacity)
-            pm.energy_consumption = self._cpu_utilization_to_energy_consumption(
-                pm_type=self._pm_config_dict[pm.pm_type],
-                cpu_utilization=pm.cpu_utilization
-            )
+        """Update CPU utilization occupied by total VMs on each PM.
+
+        The CPU cores used by the VMs on each PM are maintained incrementally when the VMs are allocated, released
+        and their CPU utilization changes, so there is no need to sum over all the VMs here.
+        """
+        pm_cpu_utilization: List[float] = (self._pm_cpu_cores_used * self._pm_inv_cpu_cores_capacity).tolist()
+
+        machines = self._machines
+        for pm_id, pm in enumerate(machines):
+            pm.update_cpu_utilization(vm=None, cpu_utilization=pm_cpu_utilization[pm_id])
+            # Read back the utilization rounded by the PM.
+            pm_cpu_utilization[pm_id] = pm.cpu_utilization
+
+        self._pm_cpu_utilization[:] = pm_cpu_utilization
+
+        pm_energy_consumption: List[float] = cpu_utilization_to_energy_consumption(
+            pm_cpu_utilization=self._pm_cpu_utilization.astype(np.float64),
+            pm_idle_power=self._pm_idle_power,
+            pm_busy_power=self._pm_busy_power,
+            pm_power_calibration_parameter=self._pm_power_calibration_parameter,
+            ticks_per_hour=float(self._ticks_per_hour)
+        ).tolist()
+        for pm_id, pm in enumerate(machines):
+            pm.energy_consumption = pm_energy_consumption[pm_id]
 
     def _overload(self, pm_id: int, tick: int):
         """Overload logic.
@@ -668,58 +924,59 @@ class VmSchedulingBusinessEngine(AbsBusinessEngine):
         # TODO: Future features of overload modeling.
         #       1. Performance degradation
         #       2. Quiesce specific VMs.
-        pm: PhysicalMachine = self._machines[pm_id]
-        vm_ids: List[int] = [vm_id for vm_id in pm.live_vms]
+        vm_ids: List[int] = self._get_pm_live_vm_ids(pm_id=pm_id)
 
         if self._kill_all_vms_if_overload:
             for vm_id in vm_ids:
-                self._total_incomes -= self._live_vms[vm_id].get_income_till_now(tick)
-                self._live_vms.pop(vm_id)
+                self._total_incomes -= self._remove_live_vm(vm_id).get_income_till_now(tick)
 
-            pm.deallocate_vms(vm_ids=vm_ids)
+            # Clear the accumulated floating-point error of the running sum.
+            self._pm_cpu_cores_used[pm_id] = 0
             self._failed_completion += len(vm_ids)
 
         self._total_overload_vms += len(vm_ids)
 
-    def _cpu_utilization_to_energy_consumption(self, pm_type: dict, cpu_utilization: float) -> float:
-        """Convert the CPU utilization to energy consumption.
-
-        The formulation refers to https://dl.acm.org/doi/epdf/10.1145/1273440.1250665
-        """
-        power: float = pm_type["power_curve"]["calibration_parameter"]
-        busy_power: int = pm_type["power_curve"]["busy_power"]
-        idle_power: int = pm_type["power_curve"]["idle_power"]
-
-        cpu_utilization /= 100
-        cpu_utilization = min(1, cpu_utilization)
-        energy_consumption_per_hour = (
-            idle_power + (busy_power - idle_power) * (2 * cpu_utilization - pow(cpu_utilization, power))
+    def _cpu_utilization_to_energy_consumption(self, pm_id: int, cpu_utilization: float) -> float:
+        """Convert the CPU utilization of a single PM to its energy consumption."""
+        pm_slice = slice(pm_id, pm_id + 1)
+
+        return float(
+            cpu_utilization_to_energy_consumption(
+                pm_cpu_utilization=np.array([cpu_utilization], dtype=np.float64),
+                pm_idle_power=self._pm_idle_power[pm_slice],
+                pm_busy_power=self._pm_busy_power[pm_slice],
+                pm_power_calibration_parameter=self._pm_power_calibration_parameter[pm_slice],
+                ticks_per_hour=float(self._ticks_per_hour)
+            )[0]
         )
 
-        return (energy_consumption_per_hour / self._ticks_per_hour) / 1000
-
     def _postpone_vm_request(self, postpone_type: PostponeType, vm_id: int, remaining_buffer_time: int):
-        """Postpone VM request."""
-        if remaining_buffer_time >= self._delay_duration:
-            if postpone_type == PostponeType.Resource:
-                self._total_latency.due_to_resource += self._delay_duration
-            elif postpone_type == PostponeType.Agent:
-                self._total_latency.due_to_agent += self._delay_duration
-
-            postpone_payload = self._pending_vm_request_payload[vm_id]
-            postpone_payload.remaining_buffer_time -= self._delay_duration
-            postpone_event = self._event_buffer.gen_cascade_event(
-                tick=self._tick + self._delay_duration,
-                event_type=Events.REQUEST,
-                payload=postpone_payload
-            )
-            self._event_buffer.insert_event(event=postpone_event)
-        else:
-            # Fail
-            # Pop out VM request payload.
+        """Postpone VM request, or fail it if the remaining buffer time can not afford another delay."""
+        if remaining_buffer_time < self._delay_duration:
+            # Pop out VM request payload and add failed allocation.
             self._pending_vm_request_payload.pop(vm_id)
-            # Add failed allocation.
             self._failed_allocation += 1
+            return
+
+        if postpone_type == PostponeType.Resource:
+            self._total_latency.due_to_resource += self._delay_duration
+        else:
+            self._total_latency.due_to_agent += self._delay_duration
+
+        # NOTE: The event objects are pooled by the event buffer, but the payloads are not reused, since the
+        # finished events still refer to them unless the finished events are disabled.
+        pending_payload = self._pending_vm_request_payload[vm_id]
+        postpone_payload = VmRequestPayload(
+            vm_info=pending_payload.vm_info,
+            remaining_buffer_time=pending_payload.remaining_buffer_time - self._delay_duration
+        )
+        self._pending_vm_request_payload[vm_id] = postpone_payload
+        postpone_event = self._event_buffer.gen_cascade_event(
+            tick=self._tick + self._delay_duration,
+            event_type=Events.REQUEST,
+            payload=postpone_payload
+        )
+        self._event_buffer.insert_event(event=postpone_event)
 
     def _get_valid_pms(
         self, vm_cpu_cores_requirement: int, vm_memory_requirement: int, vm_category: VmCategory
@@ -730,81 +987,122 @@ class VmSchedulingBusinessEngine(AbsBusinessEngine):
             vm_cpu_cores_requirement (int): The CPU cores requested by the VM.
             vm_memory_requirement (int): The memory requested by the VM.
             vm_category (VmCategory): The VM category. Delay-insensitive: 0, Interactive: 1, Unknown: 2.
+
+        Returns:
+            List[int]: The id of the valid PMs, in the order of PM id.
         """
-        # NOTE: Should we implement this logic inside the action scope?
-        valid_pm_list = []
+        valid_pm_ids = self._get_valid_pm_ids(
+            vm_cpu_cores_requirement=vm_cpu_cores_requirement,
+            vm_memory_requirement=vm_memory_requirement,
+            vm_category=vm_category
+        )
+
+        return np.sort(valid_pm_ids).tolist()
+
+    def _get_best_fit_pm(self, vm: VirtualMachine) -> int:
+        """Get the valid PM with the least free CPU cores for the VM, the one with smaller id wins the tie.
+
+        Args:
+            vm (VirtualMachine): The VM to allocate.
+
+        Returns:
+            int: The id of the best fit PM.
+        """
+        valid_pm_ids = self._get_valid_pm_ids(
+            vm_cpu_cores_requirement=vm.cpu_cores_requirement,
+            vm_memory_requirement=vm.memory_requirement,
+            vm_category=vm.category
+        )
+
+        if len(valid_pm_ids) == 0:
+            raise Exception(f"There is no valid PM for the VM: '{vm.id}'.")
+
+        # The free CPU cores index keeps the valid PMs in an ascending order of (free CPU cores, PM id).
+        return int(valid_pm_ids[0])
 
+    def _get_valid_pm_ids(
+        self, vm_cpu_cores_requirement: int, vm_memory_requirement: int, vm_category: VmCategory
+    ) -> np.ndarray:
+        """Get the id of the valid PMs, in an ascending order of the free CPU cores."""
+        # NOTE: Should we implement this logic inside the action scope?
         # Delay-insensitive: 0, Interactive: 1, and Unknown: 2.
         if vm_category == VmCategory.INTERACTIVE or vm_category == VmCategory.UNKNOWN:
-            valid_pm_list = self._get_valid_non_oversubscribable_pms(
+            return self._get_valid_non_oversubscribable_pms(
                 vm_cpu_cores_requirement=vm_cpu_cores_requirement,
                 vm_memory_requirement=vm_memory_requirement
             )
         else:
-            valid_pm_list = self._get_valid_oversubscribable_pms(
+            return self._get_valid_oversubscribable_pms(
                 vm_cpu_cores_requirement=vm_cpu_cores_requirement,
                 vm_memory_requirement=vm_memory_requirement
             )
 
-        return valid_pm_list
-
-    def _get_valid_non_oversubscribable_pms(self, vm_cpu_cores_requirement: int, vm_memory_requirement: int) -> list:
-        valid_pm_list = []
-        for pm in self._machines:
-            if pm.oversubscribable == PmState.EMPTY or pm.oversubscribable == PmState.NON_OVERSUBSCRIBABLE:
-                # In the condition of non-oversubscription, the valid PMs mean:
-                # PM allocated resource + VM allocated resource <= PM capacity.
-                if (pm.cpu_cores_allocated + vm_cpu_cores_requirement <= pm.cpu_cores_capacity
-                        and pm.memory_allocated + vm_memory_requirement <= pm.memory_capacity):
-                    valid_pm_list.append(pm.id)
-
-        return valid_pm_list
+    def _get_valid_non_oversubscribable_pms(
+        self, vm_cpu_cores_requirement: int, vm_memory_requirement: int
+    ) -> np.ndarray:
+        # In the condition of non-oversubscription, the valid PMs mean:
+        # PM allocated resource + VM allocated resource <= PM capacity.
+        # The CPU cores condition is guaranteed by the free CPU cores index.
+        pm_ids = self._get_pms_with_free_cpu_cores(min_free_cpu_cores=vm_cpu_cores_requirement)
+        pm_states = self._pm_oversubscribable[pm_ids]
+        valid_mask = (
+            ((pm_states == PmState.EMPTY) | (pm_states == PmState.NON_OVERSUBSCRIBABLE))
+            & (self._pm_memory_allocated[pm_ids] + vm_memory_requirement <= self._pm_memory_capacity[pm_ids])
+        )
 
-    def _get_valid_oversubscribable_pms(self, vm_cpu_cores_requirement: int, vm_memory_requirement: int) -> List[int]:
-        valid_pm_list = []
-        for pm in self._machines:
-            if pm.oversubscribable == PmState.EMPTY or pm.oversubscribable == PmState.OVERSUBSCRIBABLE:
-                # In the condition of oversubscription, the valid PMs mean:
-                # 1. PM allocated resource + VM allocated resource <= Max oversubscription rate * PM capacity.
-                # 2. PM CPU usage + VM requirements <= Max utilization rate * PM capacity.
-                if (
-                    (
-                        pm.cpu_cores_allocated + vm_cpu_cores_requirement
-                        <= self._max_cpu_oversubscription_rate * pm.cpu_cores_capacity
-                    ) and (
-                        pm.memory_allocated + vm_memory_requirement
-                        <= self._max_memory_oversubscription_rate * pm.memory_capacity
-                    ) and (
-                        pm.cpu_utilization / 100 * pm.cpu_cores_capacity + vm_cpu_cores_requirement
-                        <= self._max_utilization_rate * pm.cpu_cores_capacity
-                    )
-                ):
-                    valid_pm_list.append(pm.id)
+        return pm_ids[valid_mask]
+
+    def _get_valid_oversubscribable_pms(
+        self, vm_cpu_cores_requirement: int, vm_memory_requirement: int
+    ) -> np.ndarray:
+        # In the condition of oversubscription, the valid PMs mean:
+        # 1. PM allocated resource + VM allocated resource <= Max oversubscription rate * PM capacity.
+        # 2. PM CPU usage + VM requirements <= Max utilization rate * PM capacity.
+        # Due to 1, the PM free CPU cores must be at least VM requirement - the most oversubscribed CPU cores.
+        pm_ids = self._get_pms_with_free_cpu_cores(
+            min_free_cpu_cores=vm_cpu_cores_requirement - self._max_oversubscribed_cpu_cores
+        )
+        pm_states = self._pm_oversubscribable[pm_ids]
+        cpu_cores_capacity = self._pm_cpu_cores_capacity[pm_ids]
+        valid_mask = (
+            ((pm_states == PmState.EMPTY) | (pm_states == PmState.OVERSUBSCRIBABLE))
+            & (
+                self._pm_cpu_cores_allocated[pm_ids] + vm_cpu_cores_requirement
+                <= self._max_cpu_oversubscription_rate * cpu_cores_capacity
+            ) & (
+                self._pm_memory_allocated[pm_ids] + vm_memory_requirement
+                <= self._max_memory_oversubscription_rate * self._pm_memory_capacity[pm_ids]
+            ) & (
+                self._pm_cpu_utilization[pm_ids].astype(np.float64) / 100 * cpu_cores_capacity
+                + vm_cpu_cores_requirement
+                <= self._max_utilization_rate * cpu_cores_capacity
+            )
+        )
 
-        return valid_pm_list
+        return pm_ids[valid_mask]
 
     def _process_finished_vm(self):
         """Release PM resource from the finished VM."""
-        # Get the VM info.
-        vm_id_list = []
-        for vm in self._live_vms.values():
-            if vm.deletion_tick == self._tick:
-                # Release PM resources.
-                pm: PhysicalMachine = self._machines[vm.pm_id]
-                pm.cpu_cores_allocated -= vm.cpu_cores_requirement
-                pm.memory_allocated -= vm.memory_requirement
-                pm.deallocate_vms(vm_ids=[vm.id])
-                # If the VM list is empty, switch the state to empty.
-                if not pm.live_vms:
-                    pm.oversubscribable = PmState.EMPTY
-
-                vm_id_list.append(vm.id)
-                # VM completed task succeed.
-                self._successful_completion += 1
-
-        # Remove dead VM.
-        for vm_id in vm_id_list:
-            self._live_vms.pop(vm_id)
+        vm_slot_amount = self._vm_slot_amount
+        finished_vm_slots = np.flatnonzero(
+            self._vm_alive[:vm_slot_amount] & (self._vm_deletion_tick[:vm_slot_amount] == self._tick)
+        )
+        for slot in finished_vm_slots:
+            # Get the VM info and remove the dead VM.
+            vm = self._remove_live_vm(self._vm_slot_to_vm[slot].id)
+            # Release PM resources.
+            pm: PhysicalMachine = self._machines[vm.pm_id]
+            self._update_pm_allocated_resource(
+                pm=pm, cpu_cores=-vm.cpu_cores_requirement, memory=-vm.memory_requirement
+            )
+            # If the VM list is empty, switch the state to empty.
+            if self._pm_live_vm_amount[vm.pm_id] == 0:
+                self._update_pm_oversubscribable(pm=pm, oversubscribable=PmState.EMPTY)
+                # Clear the accumulated floating-point error of the running sum.
+                self._pm_cpu_cores_used[vm.pm_id] = 0
+
+            # VM completed task succeed.
+            self._successful_completion += 1
 
     def _on_vm_required(self, vm_request_event: CascadeEvent):
         """Callback when there is a VM request generated."""
@@ -862,19 +1160,23 @@ class VmSchedulingBusinessEngine(AbsBusinessEngine):
                 raise Exception(f"The VM id: '{vm_id}' sent by agent is invalid.")
 
             if type(action) == AllocateAction:
-                pm_id = action.pm_id
                 vm: VirtualMachine = self._pending_vm_request_payload[vm_id].vm_info
+                pm_id = action.pm_id
+                if pm_id is None:
+                    # The PM is left to the business engine.
+                    pm_id = self._get_best_fit_pm(vm=vm)
                 lifetime = vm.lifetime
 
                 # Update VM information.
                 vm.pm_id = pm_id
                 vm.creation_tick = cur_tick
                 vm.deletion_tick = cur_tick + lifetime
-                vm.cpu_utilization = vm.get_utilization(cur_tick=cur_tick)
+                # The VM is created at current tick, so its utilization is the head of the series.
+                vm.cpu_utilization = vm.utilization_series[0]
 
                 # Pop out the VM from pending requests and add to live VM dict.
                 self._pending_vm_request_payload.pop(vm_id)
-                self._live_vms[vm_id] = vm
+                self._add_live_vm(vm)
 
                 # Update PM resources requested by VM.
                 pm = self._machines[pm_id]
@@ -883,20 +1185,24 @@ class VmSchedulingBusinessEngine(AbsBusinessEngine):
                 if pm.oversubscribable == PmState.EMPTY:
                     # Delay-Insensitive: oversubscribable.
                     if vm.category == VmCategory.DELAY_INSENSITIVE:
-                        pm.oversubscribable = PmState.OVERSUBSCRIBABLE
+                        self._update_pm_oversubscribable(pm=pm, oversubscribable=PmState.OVERSUBSCRIBABLE)
                     # Interactive or Unknown: non-oversubscribable
                     else:
-                        pm.oversubscribable = PmState.NON_OVERSUBSCRIBABLE
+                        self._update_pm_oversubscribable(pm=pm, oversubscribable=PmState.NON_OVERSUBSCRIBABLE)
 
-                pm.allocate_vms(vm_ids=[vm.id])
-                pm.cpu_cores_allocated += vm.cpu_cores_requirement
-                pm.memory_allocated += vm.memory_requirement
+                self._update_pm_allocated_resource(
+                    pm=pm, cpu_cores=vm.cpu_cores_requirement, memory=vm.memory_requirement
+                )
                 pm.update_cpu_utilization(
-                    vm=vm,
-                    cpu_utilization=None
+                    vm=None,
+                    cpu_utilization=(
+                        pm.cpu_utilization
+                        + vm.cpu_cores_requirement * vm.cpu_utilization * self._pm_inv_cpu_cores_capacity[pm_id]
+                    )
                 )
+                self._pm_cpu_utilization[pm_id] = pm.cpu_utilization
                 pm.energy_consumption = self._cpu_utilization_to_energy_consumption(
-                    pm_type=self._pm_config_dict[pm.pm_type],
+                    pm_id=pm_id,
                     cpu_utilization=pm.cpu_utilization
                 )
                 self._successful_allocation += 1
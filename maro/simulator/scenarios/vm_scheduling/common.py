@@ -1,7 +1,7 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-from typing import List
+from typing import List, NamedTuple
 
 from .virtual_machine import VirtualMachine
 
@@ -12,6 +12,8 @@ class Action:
     Args:
         vm_id (int): The VM id.
     """
+    __slots__ = ["vm_id"]
+
     def __init__(self, vm_id: int):
         self.vm_id = vm_id
 
@@ -23,6 +25,8 @@ class PostponeAction(Action):
         vm_id (int): The VM id.
         postpone_step (int): The number of times be postponed.
     """
+    __slots__ = ["postpone_step"]
+
     def __init__(self, vm_id: int, postpone_step: int):
         super().__init__(vm_id)
         self.postpone_step = postpone_step
@@ -33,25 +37,29 @@ class AllocateAction(Action):
 
     Args:
         vm_id (int): The VM id.
-        pm_id (int): The id of the physical machine where the VM will be allocated.
+        pm_id (int): The id of the physical machine where the VM will be allocated. If None, the VM will be
+            allocated to the valid PM with the least free CPU cores (best fit) by the business engine.
     """
-    def __init__(self, vm_id: int, pm_id: int):
+    __slots__ = ["pm_id"]
+
+    def __init__(self, vm_id: int, pm_id: int = None):
         super().__init__(vm_id)
         self.pm_id = pm_id
 
 
-class VmRequestPayload:
+class VmRequestPayload(NamedTuple):
     """Payload for the VM requirement.
 
+    The payload is immutable, a postponed request is carried by a new payload with less remaining buffer time.
+
     Args:
         vm_info (VirtualMachine): The VM information.
         remaining_buffer_time (int): The remaining buffer time.
     """
-    summary_key = ["vm_info", "remaining_buffer_time"]
+    vm_info: VirtualMachine
+    remaining_buffer_time: int
 
-    def __init__(self, vm_info: VirtualMachine, remaining_buffer_time: int):
-        self.vm_info = vm_info
-        self.remaining_buffer_time = remaining_buffer_time
+    summary_key = ["vm_info", "remaining_buffer_time"]
 
 
 class DecisionPayload:
@@ -69,6 +77,10 @@ class DecisionPayload:
         "frame_index", "valid_pms", "vm_id", "vm_cpu_cores_requirement", "vm_memory_requirement",
         "remaining_buffer_time"
     ]
+    __slots__ = [
+        "frame_index", "valid_pms", "vm_id", "vm_cpu_cores_requirement", "vm_memory_requirement", "vm_sub_id",
+        "vm_category", "remaining_buffer_time"
+    ]
 
     def __init__(
         self,
@@ -98,6 +110,8 @@ class Latency:
     1. The accumulative latency triggered by the algorithm inaccurate predictions.
     2. The accumulative latency triggered by the resource exhaustion.
     """
+    __slots__ = ["due_to_agent", "due_to_resource"]
+
     def __init__(self):
         self.due_to_agent: int = 0
         self.due_to_resource: int = 0
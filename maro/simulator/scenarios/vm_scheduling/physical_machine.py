@@ -1,8 +1,6 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-from typing import List, Set
-
 from maro.backends.frame import NodeAttribute, NodeBase, node
 
 from .enums import PmState
@@ -47,9 +45,6 @@ class PhysicalMachine(NodeBase):
         self._cluster_id = 0
         self._rack_id = 0
 
-        # PM resource.
-        self._live_vms: Set[int] = set()
-
     def update_cpu_utilization(self, vm: VirtualMachine = None, cpu_utilization: float = None):
         if vm is None and cpu_utilization is None:
             raise Exception(f"Wrong calling method {self.update_cpu_utilization.__name__}")
@@ -129,22 +124,8 @@ class PhysicalMachine(NodeBase):
         self.cluster_id = self._cluster_id
         self.rack_id = self._rack_id
 
-        self._live_vms.clear()
-
         self.cpu_cores_allocated = 0
         self.memory_allocated = 0
 
         self.cpu_utilization = 0.0
         self.energy_consumption = self._idle_energy_consumption
-
-    @property
-    def live_vms(self) -> Set[int]:
-        return self._live_vms
-
-    def allocate_vms(self, vm_ids: List[int]):
-        for vm_id in vm_ids:
-            self._live_vms.add(vm_id)
-
-    def deallocate_vms(self, vm_ids: List[int]):
-        for vm_id in vm_ids:
-            self._live_vms.remove(vm_id)
@@ -21,6 +21,12 @@ class VirtualMachine:
         memory_requirement (int): The memory requested by VM. The unit is (GBs).
         lifetime (int): The lifetime of the VM, that is, deletion tick - creation tick.
     """
+    __slots__ = [
+        "id", "cpu_cores_requirement", "memory_requirement", "lifetime", "sub_id", "deployment_id", "category",
+        "unit_price", "_utilization_series", "pm_id", "slot", "_vm_table", "_cpu_utilization", "creation_tick",
+        "deletion_tick"
+    ]
+
     def __init__(
         self,
         id: int,
@@ -51,6 +57,10 @@ class VirtualMachine:
         self._utilization_series: List[float] = []
         # The physical machine Id that the VM is assigned.
         self.pm_id: int = -1
+        # The slot of the VM in the business engine VM table, only valid while the VM is alive.
+        self.slot: int = -1
+        # The owner of the VM table, the states of a living VM are read from its slot in the table.
+        self._vm_table = None
         self._cpu_utilization: float = 0.0
         self.creation_tick: int = -1
         self.deletion_tick: int = -1
@@ -61,17 +71,66 @@ class VirtualMachine:
 
     @property
     def cpu_utilization(self) -> float:
+        if self._vm_table is not None:
+            return float(self._vm_table._vm_cpu_utilization[self.slot])
+
         return self._cpu_utilization
 
     @cpu_utilization.setter
     def cpu_utilization(self, cpu_utilization: float):
+        if self._vm_table is not None:
+            raise Exception(f"The CPU utilization of the living VM {self.id} is maintained by the business engine.")
+
         self._cpu_utilization = min(max(0, cpu_utilization), 100)
 
+    @property
+    def utilization_series(self) -> List[float]:
+        """List[float]: The CPU utilization series since the VM is requested.
+
+        NOTE: While the VM is alive, its series is maintained in the VM table of the business engine.
+        """
+        if self._vm_table is not None:
+            return self._vm_table._vm_utilization_series[
+                self.slot, :self._vm_table._vm_series_length[self.slot]
+            ].tolist()
+
+        return self._utilization_series
+
+    def attach_to_vm_table(self, vm_table, slot: int):
+        """Make the VM a view of its slot in the VM table, called when the VM is allocated.
+
+        Args:
+            vm_table (VmSchedulingBusinessEngine): The business engine that owns the VM table.
+            slot (int): The slot of the VM in the VM table.
+        """
+        self.slot = slot
+        self._vm_table = vm_table
+
+    def detach_from_vm_table(self):
+        """Copy the final states out of the VM table, called before the slot of the VM is recycled."""
+        if self._vm_table is None:
+            return
+
+        self._cpu_utilization = self.cpu_utilization
+        self._utilization_series = self.utilization_series
+        self._vm_table = None
+        self.slot = -1
+
     def get_utilization(self, cur_tick: int) -> float:
-        if cur_tick - self.creation_tick > len(self._utilization_series):
+        """Get the CPU utilization at the given tick, read from the VM table while the VM is alive."""
+        index = cur_tick - self.creation_tick
+        if self._vm_table is not None:
+            series_length = self._vm_table._vm_series_length[self.slot]
+        else:
+            series_length = len(self._utilization_series)
+
+        if index < 0 or index >= series_length:
             raise Exception(f"The tick {cur_tick} is invalid for the VM {self.id}.")
 
-        return self._utilization_series[cur_tick - self.creation_tick]
+        if self._vm_table is not None:
+            return float(self._vm_table._vm_utilization_series[self.slot, index])
+
+        return self._utilization_series[index]
 
     def add_utilization(self, cpu_utilization: float):
         """VM CPU utilization list.
@@ -90,4 +149,4 @@ class VirtualMachine:
 
     def get_historical_utilization_series(self, cur_tick: int) -> List[float]:
         """"Only expose the CPU utilization series before the current tick."""
-        return self._utilization_series[:cur_tick - self.creation_tick + 1]
+        return self.utilization_series[:cur_tick - self.creation_tick + 1]
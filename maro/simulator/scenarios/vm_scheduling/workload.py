@@ -0,0 +1,115 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# The PM amount from which the energy consumption is computed in parallel,
+# below it the cost of dispatching the threads is more than the saved time.
+PARALLEL_PM_AMOUNT_THRESHOLD = 1024
+
+
+def _sum_pm_cpu_cores_used(
+    vm_pm_id: np.ndarray, vm_cpu_utilization: np.ndarray, vm_cpu_cores_requirement: np.ndarray,
+    vm_amount: int, pm_amount: int
+) -> np.ndarray:
+    """Sum the CPU cores used by the VMs on each PM.
+
+    The loop is written explicitly, so it can be compiled by numba without temporary arrays.
+
+    Args:
+        vm_pm_id (np.ndarray): The id of the PM that each VM slot is allocated to.
+        vm_cpu_utilization (np.ndarray): The CPU utilization (%) of each VM slot, in float64 to sum without loss.
+        vm_cpu_cores_requirement (np.ndarray): The CPU cores requested by each VM slot.
+        vm_amount (int): The number of used VM slots.
+        pm_amount (int): The number of PMs.
+
+    Returns:
+        np.ndarray: The CPU cores used (in the unit of cores * %) on each PM.
+    """
+    total_pm_cpu_cores_used = np.zeros(pm_amount, dtype=np.float64)
+    for i in range(vm_amount):
+        total_pm_cpu_cores_used[vm_pm_id[i]] += vm_cpu_utilization[i] * vm_cpu_cores_requirement[i]
+
+    return total_pm_cpu_cores_used
+
+
+def _sum_pm_cpu_cores_used_numpy(
+    vm_pm_id: np.ndarray, vm_cpu_utilization: np.ndarray, vm_cpu_cores_requirement: np.ndarray,
+    vm_amount: int, pm_amount: int
+) -> np.ndarray:
+    """Vectorized version of _sum_pm_cpu_cores_used, used when numba is not installed."""
+    # NOTE: np.bincount groups the weights by PM id in a single C loop, which is much faster than np.add.at.
+    return np.bincount(
+        vm_pm_id[:vm_amount],
+        weights=vm_cpu_utilization[:vm_amount] * vm_cpu_cores_requirement[:vm_amount],
+        minlength=pm_amount
+    )
+
+
+def _cpu_utilization_to_energy_consumption(
+    pm_cpu_utilization: np.ndarray, pm_idle_power: np.ndarray, pm_busy_power: np.ndarray,
+    pm_power_calibration_parameter: np.ndarray, ticks_per_hour: float
+) -> np.ndarray:
+    """Convert the CPU utilization to the energy consumption of each PM.
+
+    The formulation refers to https://dl.acm.org/doi/epdf/10.1145/1273440.1250665
+    It is written in array expressions, which numba can run in parallel.
+
+    Args:
+        pm_cpu_utilization (np.ndarray): The CPU utilization (%) of each PM.
+        pm_idle_power (np.ndarray): The idle power of each PM.
+        pm_busy_power (np.ndarray): The busy power of each PM.
+        pm_power_calibration_parameter (np.ndarray): The calibration parameter of the power curve of each PM.
+        ticks_per_hour (float): The number of ticks in an hour.
+
+    Returns:
+        np.ndarray: The energy consumption (KWh) of each PM in a tick.
+    """
+    cpu_utilization = np.minimum(1.0, pm_cpu_utilization / 100)
+    energy_consumption_per_hour = pm_idle_power + (pm_busy_power - pm_idle_power) * (
+        2 * cpu_utilization - cpu_utilization ** pm_power_calibration_parameter
+    )
+
+    return (energy_consumption_per_hour / ticks_per_hour) / 1000
+
+
+if njit is not None:
+    # Compile eagerly with the signature of the VM table, so the first tick does not pay for the compiling.
+    sum_pm_cpu_cores_used = njit("float64[:](int64[:], float64[:], int32[:], int64, int64)", cache=True)(
+        _sum_pm_cpu_cores_used
+    )
+else:
+    sum_pm_cpu_cores_used = _sum_pm_cpu_cores_used_numpy
+
+
+if njit is not None:
+    # NOTE: fastmath is not enabled, it may reorder the operations and change the results.
+    _cpu_utilization_to_energy_consumption_parallel = njit(
+        "float64[:](float64[:], float64[:], float64[:], float64[:], float64)", parallel=True, cache=True
+    )(_cpu_utilization_to_energy_consumption)
+else:
+    _cpu_utilization_to_energy_consumption_parallel = None
+
+
+def cpu_utilization_to_energy_consumption(
+    pm_cpu_utilization: np.ndarray, pm_idle_power: np.ndarray, pm_busy_power: np.ndarray,
+    pm_power_calibration_parameter: np.ndarray, ticks_per_hour: float
+) -> np.ndarray:
+    """Convert the CPU utilization to the energy consumption of each PM, in parallel if there are enough PMs.
+
+    Check _cpu_utilization_to_energy_consumption for the arguments.
+    """
+    if (
+        _cpu_utilization_to_energy_consumption_parallel is not None
+        and len(pm_cpu_utilization) >= PARALLEL_PM_AMOUNT_THRESHOLD
+    ):
+        func = _cpu_utilization_to_energy_consumption_parallel
+    else:
+        func = _cpu_utilization_to_energy_consumption
+
+    return func(pm_cpu_utilization, pm_idle_power, pm_busy_power, pm_power_calibration_parameter, ticks_per_hour)
@@ -5,13 +5,26 @@ import io
 import yaml
 import unittest
 
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
 from maro.simulator import Env
 from maro.utils import convert_dottable
 from maro.data_lib import BinaryConverter
 from maro.event_buffer import EventBuffer
 from maro.simulator.scenarios.vm_scheduling import CpuReader
-from maro.simulator.scenarios.vm_scheduling import AllocateAction, PostponeAction
+from maro.simulator.scenarios.vm_scheduling import (
+    AllocateAction, PmState, PostponeAction, VirtualMachine, VmCategory
+)
 from maro.simulator.scenarios.vm_scheduling.business_engine import VmSchedulingBusinessEngine
+from maro.simulator.scenarios.vm_scheduling.workload import (
+    _cpu_utilization_to_energy_consumption, _sum_pm_cpu_cores_used_numpy, cpu_utilization_to_energy_consumption,
+    sum_pm_cpu_cores_used
+)
 
 
 class TestCpuReader(unittest.TestCase):
@@ -127,6 +140,15 @@ class TestRegion(unittest.TestCase):
         expected = 1130
         self.assertEqual(expected, pm_amount)
 
+    def test_cached_config_not_shared(self):
+        self.be.configs.components.pm[0]["cpu"] = 0
+
+        be = VmSchedulingBusinessEngine(
+            event_buffer=EventBuffer(), topology="tests/data/vm_scheduling", start_tick=0, max_tick=3,
+            snapshot_resolution=1, max_snapshots=None, additional_options={}
+        )
+        self.assertNotEqual(0, be.configs.components.pm[0]["cpu"])
+
 
 class TestPriceModel(unittest.TestCase):
 
@@ -161,5 +183,249 @@ class TestPriceModel(unittest.TestCase):
         self.assertLess(abs(expected - total_profit), 0.01)
 
 
+class TestBestFit(unittest.TestCase):
+
+    def test_allocate_to_best_fit_pm(self):
+        env = Env(
+            scenario="vm_scheduling",
+            topology="tests/data/vm_scheduling/azure.2019.toy",
+            start_tick=0,
+            durations=5,
+            snapshot_resolution=1
+        )
+        be = env._business_engine
+        metrics, decision_event, is_done = env.step(None)
+
+        # VM 0 (interactive) is ignored.
+        self.assertEqual(0, decision_event.vm_id)
+        metrics, decision_event, is_done = env.step(None)
+
+        # VM 1 (delay-insensitive, 8 cores) is placed on the PM with the largest id.
+        self.assertEqual(1, decision_event.vm_id)
+        occupied_pm_id = decision_event.valid_pms[-1]
+        metrics, decision_event, is_done = env.step(AllocateAction(vm_id=1, pm_id=occupied_pm_id))
+
+        # VM 2 (delay-insensitive, 16 cores) fits on all the valid PMs, the occupied one is the tightest.
+        self.assertEqual(2, decision_event.vm_id)
+        valid_pms = decision_event.valid_pms
+        self.assertIn(occupied_pm_id, valid_pms)
+        free_cpu_cores = be._pm_cpu_cores_capacity[valid_pms] - be._pm_cpu_cores_allocated[valid_pms]
+        expected_pm_id = valid_pms[np.argmin(free_cpu_cores)]
+        self.assertEqual(occupied_pm_id, expected_pm_id)
+        # First fit would choose a different PM.
+        self.assertNotEqual(valid_pms[0], expected_pm_id)
+
+        vm = be._pending_vm_request_payload[2].vm_info
+        # Leave the PM to the business engine.
+        env.step(AllocateAction(vm_id=2, pm_id=None))
+
+        self.assertEqual(expected_pm_id, vm.pm_id)
+
+
+class TestVmTable(unittest.TestCase):
+
+    def setUp(self):
+        self.be = VmSchedulingBusinessEngine(
+            event_buffer=EventBuffer(), topology="tests/data/vm_scheduling", start_tick=0, max_tick=3,
+            snapshot_resolution=1, max_snapshots=None, additional_options={}
+        )
+
+    def _allocate_vm(self, vm_id: int, pm_id: int, cpu_utilization: float, tick: int = 0) -> VirtualMachine:
+        vm = VirtualMachine(
+            id=vm_id, cpu_cores_requirement=2, memory_requirement=4, lifetime=10, sub_id=0, deployment_id=0,
+            category=VmCategory.DELAY_INSENSITIVE, unit_price=1.0
+        )
+        vm.add_utilization(cpu_utilization=cpu_utilization)
+        vm.pm_id = pm_id
+        vm.creation_tick = tick
+        vm.deletion_tick = tick + vm.lifetime
+        vm.cpu_utilization = vm.utilization_series[0]
+        self.be._add_live_vm(vm)
+
+        return vm
+
+    def test_live_vm_states(self):
+        vm = self._allocate_vm(vm_id=0, pm_id=0, cpu_utilization=10.0)
+
+        # The VM with a reading updates its utilization, the missing reading is filled by the last one.
+        self.be._tick = 1
+        self.be._update_vm_workload(cur_tick_cpu_utilization={0: 30.0})
+        self.be._tick = 2
+        self.be._update_vm_workload(cur_tick_cpu_utilization={})
+
+        self.assertEqual(30.0, vm.cpu_utilization)
+        self.assertListEqual([10.0, 30.0, 30.0], vm.utilization_series)
+        self.assertListEqual([10.0, 30.0], vm.get_historical_utilization_series(cur_tick=1))
+        self.assertListEqual([10.0, 30.0, 30.0], self.be.get_vm_cpu_utilization_series(vm_id=0))
+        self.assertEqual(30.0, vm.get_utilization(cur_tick=2))
+        with self.assertRaises(Exception):
+            vm.get_utilization(cur_tick=3)
+        with self.assertRaises(Exception):
+            vm.cpu_utilization = 50.0
+
+        # The released VM keeps its final states, even after its slot is reused.
+        self.be._remove_live_vm(vm_id=0)
+        self._allocate_vm(vm_id=1, pm_id=1, cpu_utilization=80.0, tick=2)
+
+        self.assertEqual(-1, vm.slot)
+        self.assertEqual(30.0, vm.cpu_utilization)
+        self.assertListEqual([10.0, 30.0, 30.0], vm.utilization_series)
+        self.assertEqual(10.0, vm.get_utilization(cur_tick=0))
+
+    def test_slot_reuse_and_growth(self):
+        capacity = len(self.be._vm_alive)
+        vm_amount = capacity + 10
+
+        # Allocating more VMs than the capacity doubles the table.
+        vms = [self._allocate_vm(vm_id=i, pm_id=i % 5, cpu_utilization=float(i % 100)) for i in range(vm_amount)]
+        self.assertEqual(2 * capacity, len(self.be._vm_alive))
+        self.assertEqual(2 * capacity, len(self.be._vm_slot_to_vm))
+        self.assertEqual(vm_amount, self.be._vm_slot_amount)
+        self.assertListEqual(list(range(vm_amount)), [vm.slot for vm in vms])
+        self._assert_vm_table_consistent()
+
+        # Release every third VM, their slots go to the free list.
+        released_slots = set()
+        for vm in vms[::3]:
+            released_slots.add(vm.slot)
+            self.be._remove_live_vm(vm_id=vm.id)
+        self.assertSetEqual(released_slots, set(self.be._vm_free_slots))
+        self._assert_vm_table_consistent()
+
+        # The new VMs reuse the released slots before taking new ones.
+        new_vms = [
+            self._allocate_vm(vm_id=vm_amount + i, pm_id=i % 5, cpu_utilization=1.0, tick=1)
+            for i in range(len(released_slots) + 1)
+        ]
+        self.assertSetEqual(released_slots, {vm.slot for vm in new_vms[:-1]})
+        self.assertEqual(vm_amount, new_vms[-1].slot)
+        self.assertEqual(vm_amount + 1, self.be._vm_slot_amount)
+        self.assertListEqual([], self.be._vm_free_slots)
+        self._assert_vm_table_consistent()
+
+    def _assert_vm_table_consistent(self):
+        be = self.be
+        live_vm_slots = be._get_live_vm_slots().tolist()
+        self.assertEqual(len(be._live_vms), len(live_vm_slots))
+
+        for vm_id, vm in be._live_vms.items():
+            self.assertTrue(be._vm_alive[vm.slot])
+            self.assertIs(vm, be._vm_slot_to_vm[vm.slot])
+            self.assertEqual(vm_id, be._vm_id[vm.slot])
+            self.assertEqual(vm.pm_id, be._vm_pm_id[vm.slot])
+            self.assertEqual(vm.cpu_cores_requirement, be._vm_cpu_cores_requirement[vm.slot])
+
+        for slot in range(be._vm_slot_amount):
+            if not be._vm_alive[slot]:
+                self.assertIsNone(be._vm_slot_to_vm[slot])
+                self.assertEqual(0, be._vm_cpu_cores_requirement[slot])
+
+        for pm_id in range(5):
+            expected = sorted(vm.id for vm in be._live_vms.values() if vm.pm_id == pm_id)
+            self.assertListEqual(expected, sorted(be._get_pm_live_vm_ids(pm_id)))
+            self.assertEqual(len(expected), be._pm_live_vm_amount[pm_id])
+
+
+class TestPmCpuCoresUsed(unittest.TestCase):
+
+    def _assert_pm_cpu_cores_used(self, be: VmSchedulingBusinessEngine):
+        expected = np.zeros(be._pm_amount, dtype=np.float64)
+        for vm in be._live_vms.values():
+            expected[vm.pm_id] += vm.cpu_utilization * vm.cpu_cores_requirement
+
+        np.testing.assert_allclose(be._pm_cpu_cores_used, expected, rtol=0, atol=1e-9)
+
+    def test_running_sum_with_postpone_and_overload(self):
+        env = Env(
+            scenario="vm_scheduling",
+            topology="tests/data/vm_scheduling/azure.2019.overload",
+            start_tick=0,
+            durations=7,
+            snapshot_resolution=1
+        )
+        be = env._business_engine
+        # VM 0, 1, 3 oversubscribe PM 0 and overload it at tick 2, VM 2 is postponed once and then shares PM 1
+        # with VM 4, the other VMs are left to the business engine. There is a decision at every tick from 0 to 5,
+        # so the running sums are checked after the VMs of each tick are released.
+        target_pm_ids = {0: 0, 1: 0, 2: 1, 3: 0, 4: 1}
+        postponed_vm_ids = set()
+
+        metrics, decision_event, is_done = env.step(None)
+        while not is_done:
+            self._assert_pm_cpu_cores_used(be)
+
+            vm_id = decision_event.vm_id
+            if vm_id == 2 and vm_id not in postponed_vm_ids:
+                postponed_vm_ids.add(vm_id)
+                action = PostponeAction(vm_id=vm_id, postpone_step=1)
+            elif vm_id in target_pm_ids:
+                self.assertIn(target_pm_ids[vm_id], decision_event.valid_pms)
+                action = AllocateAction(vm_id=vm_id, pm_id=target_pm_ids[vm_id])
+            else:
+                action = AllocateAction(vm_id=vm_id, pm_id=None)
+            metrics, decision_event, is_done = env.step(action)
+
+        self._assert_pm_cpu_cores_used(be)
+        self.assertEqual({2}, postponed_vm_ids)
+        self.assertEqual(3, metrics["total_overload_vms"])
+        self.assertEqual(3, metrics["failed_completion"])
+        self.assertEqual(6, metrics["successful_completion"])
+        self.assertEqual(0, len(be._live_vms))
+        for pm_id in (1, 2):
+            self.assertEqual(PmState.EMPTY, be._pm_oversubscribable[pm_id])
+        self.assertListEqual([0.0, 0.0, 0.0], be._pm_cpu_cores_used.tolist())
+
+
+class TestWorkload(unittest.TestCase):
+
+    def test_sum_pm_cpu_cores_used(self):
+        vm_pm_id = np.array([0, 2, 0, 1, 0, 0], dtype=np.int64)
+        vm_cpu_utilization = np.array([10.0, 50.0, 20.5, 0.0, 100.0, 0.0], dtype=np.float64)
+        vm_cpu_cores_requirement = np.array([2, 4, 8, 16, 1, 0], dtype=np.int32)
+
+        # The last slot is not used.
+        expected = [10.0 * 2 + 20.5 * 8 + 100.0 * 1, 0.0, 50.0 * 4]
+        for func in (sum_pm_cpu_cores_used, _sum_pm_cpu_cores_used_numpy):
+            total = func(vm_pm_id, vm_cpu_utilization, vm_cpu_cores_requirement, 5, 3)
+            self.assertListEqual(expected, list(total))
+
+    @unittest.skipUnless(numba, "numba is not installed")
+    def test_compiled_sum_pm_cpu_cores_used(self):
+        # With numba installed, the reduction should be the compiled kernel rather than the NumPy fallback.
+        self.assertIsInstance(sum_pm_cpu_cores_used, numba.core.registry.CPUDispatcher)
+
+        rng = np.random.RandomState(0)
+        vm_amount, pm_amount = 1000, 50
+        vm_pm_id = rng.randint(0, pm_amount, vm_amount).astype(np.int64)
+        vm_cpu_utilization = rng.uniform(-100, 100, vm_amount)
+        vm_cpu_cores_requirement = rng.randint(1, 32, vm_amount).astype(np.int32)
+
+        np.testing.assert_allclose(
+            sum_pm_cpu_cores_used(vm_pm_id, vm_cpu_utilization, vm_cpu_cores_requirement, vm_amount, pm_amount),
+            _sum_pm_cpu_cores_used_numpy(vm_pm_id, vm_cpu_utilization, vm_cpu_cores_requirement, vm_amount, pm_amount),
+            rtol=1e-12
+        )
+
+    def test_cpu_utilization_to_energy_consumption(self):
+        pm_amount = 2048
+        pm_cpu_utilization = np.linspace(0, 120, pm_amount)
+        pm_idle_power = np.full(pm_amount, 120.0)
+        pm_busy_power = np.full(pm_amount, 185.0)
+        pm_power_calibration_parameter = np.full(pm_amount, 1.4)
+
+        expected = []
+        for cpu_utilization in pm_cpu_utilization.tolist():
+            cpu_utilization = min(1, cpu_utilization / 100)
+            expected.append(((120 + (185 - 120) * (2 * cpu_utilization - pow(cpu_utilization, 1.4))) / 12) / 1000)
+
+        # The PM amount reaches the parallel threshold, so the first one runs the numba kernel if numba is installed.
+        # The vectorized power may differ from the scalar pow in the last bit, depending on the NumPy build.
+        for func in (cpu_utilization_to_energy_consumption, _cpu_utilization_to_energy_consumption):
+            energy_consumption = func(
+                pm_cpu_utilization, pm_idle_power, pm_busy_power, pm_power_calibration_parameter, 12.0
+            )
+            np.testing.assert_allclose(energy_consumption, expected, rtol=1e-12)
+
+
 if __name__ == "__main__":
     unittest.main()